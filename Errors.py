@@ -0,0 +1,85 @@
+
+# error codes returned by Transaction.Costing.build() and Transaction.Payroll.build()
+BAD_VALUE = 'BAD_VALUE'
+UNKNOWN_ELEMENT = 'UNKNOWN_ELEMENT'
+INVALID_ACCOUNT = 'INVALID_ACCOUNT'
+ZERO_EMPLOYEE = 'ZERO_EMPLOYEE'
+ZERO_COMPANY = 'ZERO_COMPANY'
+ZERO_DEPARTMENT = 'ZERO_DEPARTMENT'
+ZERO_ACCOUNT = 'ZERO_ACCOUNT'
+
+descriptions = {
+    BAD_VALUE: 'Value could not be converted to the required type',
+    UNKNOWN_ELEMENT: 'Element does not exist in the element lookup table',
+    INVALID_ACCOUNT: 'Account does not exist in the element lookup table for this element',
+    ZERO_EMPLOYEE: 'Employee ID can not be zero',
+    ZERO_COMPANY: 'Company number can not be zero',
+    ZERO_DEPARTMENT: 'Department number can not be zero',
+    ZERO_ACCOUNT: 'Account number can not be zero'
+}
+
+
+class ParseError:
+
+    def __init__(self, code: str, field: str, value: str = '', element: str = ''):
+        self.code = code
+        self.field = field
+        self.value = value
+        self.element = element
+
+    def cause(self) -> tuple:
+        '''
+        Returns a key that identifies the distinct cause of the error. All errors with
+        the same cause are reported together as a single line.
+        '''
+        return (self.code, self.field, self.value, self.element)
+
+    def __str__(self):
+        s = descriptions.get(self.code, self.code) + ': '
+        s += self.field + ' = ' + str(self.value)
+        if self.element:
+            s += ' for element ' + self.element
+        return s
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ErrorLog:
+
+    def __init__(self, limit: int = 1000):
+        '''
+        limit:  The number of rows with errors after which parsing should be abandoned.
+                Zero or a negative number means there is no limit.
+        '''
+        self.limit = limit
+        self.count = 0
+        self.causes = {}
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.causes.values())
+
+    def add(self, error: ParseError, file_name: str, row: int) -> None:
+        '''
+        Records an error that occurred on a row of an input file. Only the first
+        occurrence of each distinct cause is kept; later occurrences are counted.
+        '''
+        self.count += 1
+        entry = self.causes.get(error.cause(), None)
+        if entry:
+            entry['Count'] += 1
+        else:
+            self.causes[error.cause()] = {'Code': error.code,
+                                          'Description': descriptions.get(error.code, error.code),
+                                          'Field': error.field,
+                                          'Value': error.value,
+                                          'Element': error.element,
+                                          'File': file_name,
+                                          'First Row': row,
+                                          'Count': 1}
+
+    def limit_reached(self) -> bool:
+        return self.limit > 0 and self.count >= self.limit
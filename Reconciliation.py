@@ -1,10 +1,74 @@
 
 import csv
 import Element
+import Errors
 import Transaction
 import Employee
+import numpy as np
+import pandas as pd
 from collections import Counter
-from itertools import combinations
+from functools import lru_cache
+
+
+def cents(amount: float) -> int:
+    '''
+    Converts a dollar amount to a whole number of cents so that amounts can be compared exactly.
+    '''
+    return round(amount * 100)
+
+
+def search_combo(amounts: tuple, target: int, tolerance: int) -> tuple:
+    '''
+    Searches for a combination of amounts (in cents) whose absolute sum is within the tolerance
+    of the target and returns the indexes of the amounts used, or an empty tuple. The amounts must
+    be sorted largest first so that a branch can be abandoned as soon as the remaining amounts can
+    no longer bring the partial sum within range.
+    '''
+    n = len(amounts)
+
+    # the most and the least that the amounts from index i onward can add to a partial sum
+    most = [0] * (n + 1)
+    least = [0] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        most[i] = most[i + 1] + max(amounts[i], 0)
+        least[i] = least[i + 1] + min(amounts[i], 0)
+
+    chosen = []
+
+    def search(i: int, partial: int, lo: int, hi: int) -> bool:
+        if chosen and lo <= partial <= hi:
+            return True
+        if i == n or partial + most[i] < lo or partial + least[i] > hi:
+            return False
+        chosen.append(i)
+        if search(i + 1, partial + amounts[i], lo, hi):
+            return True
+        chosen.pop()
+        return search(i + 1, partial, lo, hi)
+
+    if search(0, 0, target - tolerance, target + tolerance) or search(0, 0, -target - tolerance, -target + tolerance):
+        return tuple(chosen)
+    return ()
+
+
+# The same split-costing shapes recur across employees in a pay period, so the results of
+# search_combo() are kept in a bounded LRU cache keyed by the sorted amounts and the target.
+cached_search_combo = lru_cache(maxsize=4096)(search_combo)
+
+
+def set_combo_cache_size(size: int) -> None:
+    '''
+    Replaces the combination cache with an empty one that holds up to size results.
+    '''
+    global cached_search_combo
+    cached_search_combo = lru_cache(maxsize=size)(search_combo)
+
+
+def combo_cache_info() -> tuple:
+    '''
+    Returns the hits, misses, maxsize, and currsize of the combination cache.
+    '''
+    return cached_search_combo.cache_info()
 
 
 ####################################################################
@@ -12,7 +76,7 @@ from itertools import combinations
 #
 #                tree
 #                  |
-#              employees
+#         employee numbers
 #                  |
 #               elements
 #               /     \
@@ -25,19 +89,30 @@ class Tree:
 
     def __init__(self):
         self.tree = {}
+        self.net_pays = {}
+
+    def employee(self, number: int) -> Employee.Employee:
+        '''
+        Returns an Employee object for an employee number in the tree, or None.
+        '''
+        if number not in self.tree:
+            return None
+        employee = Employee.Employee(number)
+        employee.net_pays.update(self.net_pays.get(number, ()))
+        return employee
 
     def build_summary_table(self) -> list:
         '''
         This function productes a table with one row for each element.
         '''
 
-        def calc_diff(element: Element.Element, unreconciled: list) -> float:
+        def calc_diff(element: Element.Element, records: list) -> float:
             '''
-            This nested function calculates the difference between the unreconciled payroll
-            and unreconciled costing elements.
+            This nested function calculates the difference between the payroll and costing
+            elements in a list of records.
             '''
-            pr = sum(x.amount for x in unreconciled if isinstance(x, Transaction.Payroll))
-            cost = sum(x.amount for x in unreconciled if isinstance(x, Transaction.Costing) and x.account in element.debit_accounts)
+            pr = sum(x.amount for x in records if isinstance(x, Transaction.Payroll))
+            cost = sum(x.amount for x in records if isinstance(x, Transaction.Costing) and x.account in element.debit_accounts)
             return round(pr - cost, 2)
 
         summary_table = []
@@ -69,7 +144,10 @@ class Tree:
 
                 ctr['Difference'] += calc_diff(element, unreconciled)
 
-        column_names = ['Category', 'Element', 'Payroll Total', 'Difference']
+                # reconciled entries only differ when they were matched within the rounding tolerance
+                ctr['Rounding'] += calc_diff(element, reconciled)
+
+        column_names = ['Category', 'Element', 'Payroll Total', 'Difference', 'Rounding']
         column_names.extend(sorted(account_numbers))
         default_values = {name: 0.0 for name in column_names}
 
@@ -84,53 +162,62 @@ class Tree:
 
     def build_correcting_je(self) -> tuple:
         '''
-        This function builds a correcting journal entry for all unreconciled transactions and
-        returns them in a tuple containing a list of the debits and credits and the list headers.
+        This function builds a correcting journal entry for all unreconciled transactions. The lines
+        are generated for all employees and elements at once from a columnar batch of the unreconciled
+        transactions. It returns a tuple containing a DataFrame of the debits and credits and a list of
+        errors for each employee and element whose lines do not balance, which are left out of the JE.
         '''
-        entries = []
         fields = ['Category', 'Element', 'Employee', 'Company', 'Department', 'Account', 'Amount', 'Description']
+        batch = {'Category': [], 'Element': [], 'Employee': [], 'Company': [], 'Department': [], 'Account': [],
+                 'Debit Account': [], 'Credit Account': [], 'Amount': [], 'Payroll': []}
 
-        def post(je, category, element, employee, company, dept, acct, amt, msg):
-            je.append({'Category': category,
-                       'Element': element,
-                       'Employee': employee,
-                       'Company': company,
-                       'Department': dept,
-                       'Account': acct,
-                       'Amount': round(amt, 2),
-                       'Description': msg})
-
+        # Gather the unreconciled transactions into columns.
         for employee, elements in self.tree.items():
             for element, pair_of_lists in elements.items():
-
                 _, unreconciled = pair_of_lists
-
-                je = []
-
-                # Iterate over all the unreconciled transactions.
                 for t in unreconciled:
-                    # Reverse the costing transactions
-                    if isinstance(t, Transaction.Costing):
-                        msg = f'Rev cost err for {employee.number}'
-                        post(je, element.payroll_category, element.payroll_name, employee.number, t.company, t.department, t.account, -t.amount, msg)
-                    # Post the payroll transactions
-                    if isinstance(t, Transaction.Payroll):
-                        dr_acct = element.debit_accounts[0]
-                        cr_acct = element.credit_accounts[0]
-                        dr_dept = 90000 if dr_acct < 400000 else 700001
-                        cr_dept = 90000 if cr_acct < 400000 else 700001
-                        msg = f'Fix cost err for {employee.number}'
-                        post(je, element.payroll_category, element.payroll_name, employee.number, 1100, dr_dept, dr_acct, t.amount, msg)
-                        post(je, element.payroll_category, element.payroll_name, employee.number, 1100, cr_dept, cr_acct, -t.amount, msg)
-
-                # Raise an excpetion if the debits and credits in the JE do not balance
-                if round(sum(t['Amount'] for t in je), 2) != 0.0:
-                    raise ValueError(f'Unable to calculate correcting je for {element.payroll_name} for employee {employee.number}')
-
-                # Add the JE to the larger JE
-                entries.extend(je)
-
-        return (entries, fields)
+                    is_payroll = isinstance(t, Transaction.Payroll)
+                    batch['Category'].append(element.payroll_category)
+                    batch['Element'].append(element.payroll_name)
+                    batch['Employee'].append(employee)
+                    batch['Company'].append(0 if is_payroll else t.company)
+                    batch['Department'].append(0 if is_payroll else t.department)
+                    batch['Account'].append(0 if is_payroll else t.account)
+                    batch['Debit Account'].append(element.debit_accounts[0])
+                    batch['Credit Account'].append(element.credit_accounts[0])
+                    batch['Amount'].append(t.amount)
+                    batch['Payroll'].append(is_payroll)
+
+        if len(batch['Amount']) == 0:
+            return (pd.DataFrame(columns=fields), [])
+
+        batch = pd.DataFrame(batch)
+        batch['Line'] = batch.index * 2
+        payroll = batch[batch['Payroll']]
+
+        # Reverse the costing transactions
+        reversals = batch[~batch['Payroll']].assign(Amount=lambda df: -df['Amount'],
+                                                    Description=lambda df: 'Rev cost err for ' + df['Employee'].astype(str))
+
+        # Post the payroll transactions
+        debits = payroll.assign(Account=payroll['Debit Account'])
+        credits = payroll.assign(Account=payroll['Credit Account'], Amount=-payroll['Amount'], Line=payroll['Line'] + 1)
+        reposts = pd.concat([debits, credits])
+        reposts['Company'] = 1100
+        reposts['Department'] = np.where(reposts['Account'] < 400000, 90000, 700001)
+        reposts['Description'] = 'Fix cost err for ' + reposts['Employee'].astype(str)
+
+        je = pd.concat([reversals, reposts]).sort_values('Line', kind='stable')
+        je['Amount'] = je['Amount'].round(2)
+
+        # Leave out and report every employee and element whose debits and credits do not balance
+        balances = je['Amount'].mul(100).round().astype('int64').groupby([je['Employee'], je['Element']]).sum()
+        unbalanced = balances[balances != 0].index
+        errors = [{'Description': f'Unable to calculate correcting je for {element}', 'Employee': employee} for employee, element in unbalanced]
+        if len(errors) > 0:
+            je = je[~pd.MultiIndex.from_frame(je[['Employee', 'Element']]).isin(unbalanced)]
+
+        return (je[fields].reset_index(drop=True), errors)
 
     def build_unreconciled_entries(self) -> tuple:
         '''
@@ -145,7 +232,7 @@ class Tree:
             entries.append({'Source': source,
                             'Category': category,
                             'Element': element,
-                            'Employee': employee.number,
+                            'Employee': employee,
                             'Company': company,
                             'Department': department,
                             'Account': account,
@@ -182,17 +269,21 @@ class Tree:
 
         return (entries, fields)
 
-    def reconcile(self) -> list:
+    def reconcile(self, employees: list = None, tolerance: float = 0.0) -> list:
         '''
         This nested function attempts to reconcile all payroll and costing entries. It also validates
         the reconciled entries after they are reconciled for each element and employee. It does not do
-        anything with unreconciled entries after the reconciliation process is completed.
+        anything with unreconciled entries after the reconciliation process is completed. If a list of
+        employees is passed, then only those employees are reconciled. Payroll and costing amounts
+        that differ by no more than the tolerance are matched and reported as rounding differences.
         '''
 
-        def net_pay_recalculates(employee: Employee.Employee, elements: dict) -> bool:
+        tol = cents(tolerance)
+
+        def net_pay_recalculates(employee: int, elements: dict) -> bool:
             '''
             This function recalculates the total net pay for an employee's payroll elements
-            and compares it to the net pay in the employee object. If the two are different,
+            and compares it to the net pay on the payroll register. If the two are different,
             then it indicates a technical issue with the original data file.
             '''
             counter = Counter()
@@ -206,18 +297,18 @@ class Tree:
             total -= counter['Involuntary Deductions']
             total -= counter['Pretax Deductions']
             total -= counter['Voluntary Deductions']
-            return True if round(total, 2) == employee.total_net_pay() else False
+            return True if round(total, 2) == round(sum(self.net_pays.get(employee, ())), 2) else False
 
-        def normal_costing_entry(element: Element.Element, reconciled: list, unreconciled: list) -> None:
+        def normal_costing_entry(element: Element.Element, reconciled: list, unreconciled: list, tol: int) -> None:
             '''
-            This nested function determines if the sum of the payroll entries is equal to
-            both the sum of all debits and the sum of all credits for all costing entries.
+            This nested function determines if the sum of the payroll entries is equal to (within
+            tol cents of) both the sum of all debits and the sum of all credits for all costing entries.
             If so, then it moves all the entries from the unreconciled list to the reconciled list.
             '''
-            pr = round(sum(x.amount for x in unreconciled if isinstance(x, Transaction.Payroll)), 2)
-            dr = round(sum(x.amount for x in unreconciled if isinstance(x, Transaction.Costing) and x.account in element.debit_accounts), 2)
-            cr = round(sum(x.amount for x in unreconciled if isinstance(x, Transaction.Costing) and x.account in element.credit_accounts), 2)
-            if dr == pr and cr == -pr:
+            pr = cents(sum(x.amount for x in unreconciled if isinstance(x, Transaction.Payroll)))
+            dr = cents(sum(x.amount for x in unreconciled if isinstance(x, Transaction.Costing) and x.account in element.debit_accounts))
+            cr = cents(sum(x.amount for x in unreconciled if isinstance(x, Transaction.Costing) and x.account in element.credit_accounts))
+            if abs(dr - pr) <= tol and abs(cr + pr) <= tol and dr == -cr:
                 reconciled.extend(unreconciled)
                 unreconciled.clear()
 
@@ -237,17 +328,28 @@ class Tree:
                     for r in reclassifications:
                         unreconciled.remove(r)
 
-        def brute_force_method(element: Element.Element, reconciled: list, unreconciled: list) -> list:
+        def brute_force_method(element: Element.Element, reconciled: list, unreconciled: list, tol: int) -> list:
             '''
             This nested function tries the remaining combinations.
             '''
             def find_combo(records: list, total: float) -> tuple:
-                if len(records) < 20:
-                    for n in range(1, len(records) + 1):
-                        for combo in combinations(records, n):
-                            if round(abs(sum(x.amount for x in combo)), 2) == round(abs(total), 2):
-                                return combo
-                return ()
+                '''
+                Returns a combination of records whose absolute sum equals the absolute value of total,
+                or failing that, is within tol cents of it. The records are put in the canonical order
+                expected by search_combo() so that the same amounts always produce the same cache key.
+                '''
+                if len(records) == 0 or len(records) >= 20:
+                    return ()
+                pairs = sorted(((cents(x.amount), x) for x in records), key=lambda p: (-abs(p[0]), p[0]))
+                amounts = tuple(p[0] for p in pairs)
+                target = abs(cents(total))
+                if tol == 0:
+                    indexes = cached_search_combo(amounts, target, 0)
+                else:
+                    # The exact pass has usually looked up these amounts already, so the exact
+                    # search is repeated without the cache to keep it from counting as a hit.
+                    indexes = search_combo(amounts, target, 0) or cached_search_combo(amounts, target, tol)
+                return tuple(pairs[i][1] for i in indexes)
 
             for pr in [x for x in unreconciled if isinstance(x, Transaction.Payroll)]:
                 temp = []
@@ -264,13 +366,15 @@ class Tree:
 
         errors = []
 
-        for employee, elements in self.tree.items():
+        for employee in (employees if employees is not None else self.tree):
+
+            elements = self.tree[employee]
 
             # Net pay must recalculate for all employees, otherwise a reconciliation
             # can not be reliably performed. This typically indicates a technical issue
             # with the dataset and probably the original input file.
             if not net_pay_recalculates(employee, elements):
-                raise ValueError(f'Net pay does not recalculate for employee {employee.number}.')
+                raise ValueError(f'Net pay does not recalculate for employee {employee}.')
 
             for element, pair_of_lists in elements.items():
 
@@ -280,43 +384,48 @@ class Tree:
                 # can not be reliably performed. This typically indicates a technical issue
                 # with the dataset and probably the original input file.
                 if round(sum(entry.amount for entry in unreconciled if isinstance(entry, Transaction.Costing)), 2) != 0.0:
-                    raise ValueError(f'Reconciliation can not be performed because unreconciled debits do not equal unreconciled credits for "{element.costing_name}" for employee {employee.number}.')
+                    raise ValueError(f'Reconciliation can not be performed because unreconciled debits do not equal unreconciled credits for "{element.costing_name}" for employee {employee}.')
 
-                # Try different methods to reconcile the payroll and costing entries.
-                normal_costing_entry(element, reconciled, unreconciled)
+                # Try different methods to reconcile the payroll and costing entries. Exact
+                # matches are always tried first so that a rounding difference is only
+                # accepted when no exact match exists.
+                normal_costing_entry(element, reconciled, unreconciled, 0)
                 departmental_reclass(reconciled, unreconciled)
-                brute_force_method(element, reconciled, unreconciled)
+                brute_force_method(element, reconciled, unreconciled, 0)
+                if tol > 0 and len(unreconciled) > 0:
+                    normal_costing_entry(element, reconciled, unreconciled, tol)
+                    brute_force_method(element, reconciled, unreconciled, tol)
 
                 # If any unreconciled transactions remain, then log an error.
                 if len(unreconciled) > 0:
-                    errors.append({'Description': f'Reconciliation could not be completed for "{element.payroll_name}"', 'Employee': employee.number})
+                    errors.append({'Description': f'Reconciliation could not be completed for "{element.payroll_name}"', 'Employee': employee})
 
                 # If the reconciled debits and credits do not balance, then log an error.
                 if round(sum(trans.amount for trans in reconciled if isinstance(trans, Transaction.Costing)), 2) != 0.0:
-                    raise ValueError(f'Reconciled debits do not equal reconciled credits for "{element.payroll_name}" for employee {employee.number}.')
+                    raise ValueError(f'Reconciled debits do not equal reconciled credits for "{element.payroll_name}" for employee {employee}.')
 
                 # If there is a difference between the payroll transaction(s) and the costing transactions, then log an error.
                 p = sum(trans.amount for trans in reconciled if isinstance(trans, Transaction.Payroll))
                 c = sum(trans.amount for trans in reconciled if isinstance(trans, Transaction.Costing) and trans.account in element.debit_accounts)
                 diff = round(p - c, 2)
-                if diff != 0.0:
-                    errors.append({'Description': f'Unreconciled difference of ${diff} between payroll and costing elements was detected for "{element.payroll_name}"', 'Employee': employee.number})
+                if diff != 0.0 and abs(cents(diff)) <= tol:
+                    errors.append({'Description': f'Rounding difference of ${diff} between payroll and costing elements was detected for "{element.payroll_name}"', 'Employee': employee})
+                elif diff != 0.0:
+                    errors.append({'Description': f'Unreconciled difference of ${diff} between payroll and costing elements was detected for "{element.payroll_name}"', 'Employee': employee})
 
         return errors
 
     @staticmethod
-    def build(input_files: list, element_table: Element.ElementTable, name_substitutions: dict) -> tuple:
-
-        def update_ee(employee: Employee.Employee, employees: dict) -> Employee.Employee:
-            ee = employees.get(employee.number, None)
-            if ee:
-                ee.add_net_pay(employee)
-                return ee
-            else:
-                employees[employee.number] = employee
-            return employee
+    def build(input_files: list, element_table: Element.ElementTable, name_substitutions: dict, error_limit: int = 1000, only: set = None) -> tuple:
+        '''
+        This function parses the input files and builds the reconciliation tree. It returns a tuple
+        containing the tree and an Errors.ErrorLog of the problems found in the input files. Parsing
+        stops early once the number of errors reaches error_limit. If a set of employee numbers is
+        passed as only, then transactions and errors for all other employees are skipped, along with
+        errors for rows whose employee number could not be read.
+        '''
 
-        def add_unreconciled(tree, employee: Employee.Employee, element: Element.Element, transaction: Transaction.Transaction) -> None:
+        def add_unreconciled(tree, employee: int, element: Element.Element, transaction: Transaction.Transaction) -> None:
             elements = tree.get(employee, None)
             if elements:
                 records_tup = elements.get(element, None)
@@ -328,8 +437,8 @@ class Tree:
                 tree[employee] = {element: ([], [transaction])}
 
         tree = Tree()
-        errors = []
-        employees = {}
+        errors = Errors.ErrorLog(error_limit)
+        payment = None
 
         for f in input_files:
             with open(f, 'r', newline='') as csvfile:
@@ -342,11 +451,24 @@ class Tree:
                     raise SyntaxError(f'{csvfile.name} does not contain the correct headers for a payroll register or costing file.')
                 print('Parsing file', csvfile.name)
                 for row in reader:
-                    try:
-                        employee, element, transaction = build_transaction(row, element_table, name_substitutions)
-                        if isinstance(employee, Employee.Employee):
-                            employee = update_ee(employee, employees)
-                            add_unreconciled(tree.tree, employee, element, transaction)
-                    except Exception as e:
-                        errors.append(str(e))
+                    employee, element, transaction, net_pay = build_transaction(row, element_table, name_substitutions)
+                    if only is not None and employee not in only:
+                        continue
+                    if element is not None:
+                        add_unreconciled(tree.tree, employee, element, transaction)
+                        # Net pay repeats on every balance row of a payment, so it is only recorded
+                        # when the payment changes. The register has no payment identifier, so as
+                        # before a payment is identified by its net pay and two payments to the same
+                        # employee with the same net pay are counted once.
+                        if net_pay is not None and (employee, net_pay) != payment:
+                            payment = (employee, net_pay)
+                            net_pays = tree.net_pays.get(employee, None)
+                            if net_pays is None:
+                                tree.net_pays[employee] = {net_pay}
+                            else:
+                                net_pays.add(net_pay)
+                    elif transaction is not None:
+                        errors.add(transaction, csvfile.name, reader.line_num)
+                        if errors.limit_reached():
+                            return (tree, errors)
         return (tree, errors)
@@ -0,0 +1,196 @@
+
+import json
+import Element
+import Reconciliation
+import Transaction
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import unquote, urlsplit
+
+
+class Service:
+    '''
+    Keeps a reconciled pay period in memory and answers lookups by employee, element,
+    account, or department. Individual employees can be re-reconciled after the input
+    files have been corrected without rebuilding the whole tree.
+    '''
+
+    def __init__(self, input_files: list, elements_file: str, name_substitutions: dict, error_limit: int = 1000, tolerance: float = 0.0):
+        self.input_files = input_files
+        self.elements_file = elements_file
+        self.name_substitutions = name_substitutions
+        self.error_limit = error_limit
+        self.tolerance = tolerance
+        self.load()
+
+    def load(self) -> None:
+        '''
+        Parses the input files, reconciles every employee, and builds the lookup indexes.
+        '''
+        self.element_table = Element.Parser.parse(self.elements_file)
+        self.tree, self.parse_errors = Reconciliation.Tree.build(self.input_files, self.element_table, self.name_substitutions, self.error_limit)
+        self.errors = {}
+        self.problematic = set()
+        self.index = {'element': {}, 'account': {}, 'department': {}}
+        if len(self.parse_errors) > 0:
+            return
+        for employee in self.tree.tree:
+            self.add_to_index(employee)
+            self.reconcile_employee(employee)
+
+    def reconcile_employee(self, employee: int) -> None:
+        '''
+        Reconciles one employee and records the errors and whether the employee is problematic.
+        An employee that can not be reconciled is kept so that the input can be fixed and the
+        employee re-reconciled.
+        '''
+        try:
+            for err in self.tree.reconcile([employee], self.tolerance):
+                self.errors.setdefault(err['Employee'], []).append(err['Description'])
+        except ValueError as err:
+            self.errors.setdefault(employee, []).append(str(err))
+        if any(len(unreconciled) > 0 for _, unreconciled in self.tree.tree[employee].values()):
+            self.problematic.add(employee)
+        else:
+            self.problematic.discard(employee)
+
+    def add_to_index(self, employee: int) -> None:
+        for element, pair_of_lists in self.tree.tree[employee].items():
+            self.index['element'].setdefault(element.payroll_name.casefold(), set()).add(employee)
+            self.index['element'].setdefault(element.costing_name.casefold(), set()).add(employee)
+            for records in pair_of_lists:
+                for t in records:
+                    if isinstance(t, Transaction.Costing):
+                        self.index['account'].setdefault(str(t.account), set()).add(employee)
+                        self.index['department'].setdefault(str(t.department), set()).add(employee)
+
+    def remove_from_index(self, employee: int) -> None:
+        for keys in self.index.values():
+            for numbers in keys.values():
+                numbers.discard(employee)
+
+    def employee(self, number: int) -> dict:
+        '''
+        Returns everything that is known about an employee's reconciliation.
+        '''
+        employee = self.tree.employee(number)
+        if employee is None:
+            return None
+
+        def to_dict(t: Transaction.Transaction) -> dict:
+            if isinstance(t, Transaction.Costing):
+                return {'Source': 'Costing files', 'Company': t.company, 'Department': t.department, 'Account': t.account, 'Amount': t.amount}
+            return {'Source': 'Payroll register', 'Amount': t.amount}
+
+        elements = []
+        for element, pair_of_lists in self.tree.tree[number].items():
+            reconciled, unreconciled = pair_of_lists
+            elements.append({'Category': element.payroll_category,
+                             'Element': element.payroll_name,
+                             'Reconciled': [to_dict(t) for t in reconciled],
+                             'Unreconciled': [to_dict(t) for t in unreconciled]})
+        return {'Employee': number,
+                'Net Pay': employee.total_net_pay(),
+                'Problematic': any(len(e['Unreconciled']) > 0 for e in elements),
+                'Errors': self.errors.get(number, []),
+                'Elements': elements}
+
+    def lookup(self, kind: str, key: str) -> dict:
+        '''
+        Returns the employees with transactions for an element, account, or department and
+        the subset of those employees that have unreconciled transactions.
+        '''
+        keys = self.index.get(kind, None)
+        if keys is None:
+            return None
+        numbers = keys.get(key.casefold(), set())
+        return {kind.capitalize(): key, 'Employees': sorted(numbers), 'Problematic': sorted(numbers & self.problematic)}
+
+    def reconcile(self, number: int) -> dict:
+        '''
+        Re-reads the element table and the input files for a single employee, replaces the
+        employee's branch of the tree, and reconciles it again.
+        '''
+        self.element_table = Element.Parser.parse(self.elements_file)
+        fresh, parse_errors = Reconciliation.Tree.build(self.input_files, self.element_table, self.name_substitutions, self.error_limit, only={number})
+        if len(parse_errors) > 0:
+            return {'Employee': number, 'Parse Errors': list(parse_errors)}
+        if number in self.tree.tree:
+            self.remove_from_index(number)
+            del self.tree.tree[number]
+        self.tree.net_pays.pop(number, None)
+        self.errors.pop(number, None)
+        self.problematic.discard(number)
+        for employee, elements in fresh.tree.items():
+            self.tree.tree[employee] = elements
+            self.tree.net_pays[employee] = fresh.net_pays.get(employee, set())
+            self.add_to_index(employee)
+            self.reconcile_employee(employee)
+        return self.employee(number)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''
+    Routes:
+        GET  /employee/<number>
+        GET  /element/<name>
+        GET  /account/<number>
+        GET  /department/<number>
+        GET  /stats
+        POST /employee/<number>/reconcile
+    '''
+
+    service = None
+
+    def send_json(self, status: int, body) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self) -> list:
+        return [unquote(p) for p in urlsplit(self.path).path.strip('/').split('/')]
+
+    def do_GET(self):
+        parts = self.route()
+        if parts == ['stats']:
+            hits, misses, maxsize, currsize = Reconciliation.combo_cache_info()
+            return self.send_json(200, {'Combo Cache': {'Hits': hits, 'Misses': misses, 'Size': maxsize, 'Used': currsize}})
+        if len(parts) != 2:
+            return self.send_json(404, {'Error': 'Unknown route'})
+        kind, key = parts
+        if kind == 'employee':
+            if not key.isdigit():
+                return self.send_json(400, {'Error': 'Employee number must be an integer'})
+            body = self.service.employee(int(key))
+        else:
+            body = self.service.lookup(kind, key)
+        if body is None:
+            return self.send_json(404, {'Error': f'{kind} {key} was not found'})
+        self.send_json(200, body)
+
+    def do_POST(self):
+        parts = self.route()
+        if len(parts) != 3 or parts[0] != 'employee' or parts[2] != 'reconcile':
+            return self.send_json(404, {'Error': 'Unknown route'})
+        if not parts[1].isdigit():
+            return self.send_json(400, {'Error': 'Employee number must be an integer'})
+        body = self.service.reconcile(int(parts[1]))
+        if body is None:
+            return self.send_json(404, {'Error': f'employee {parts[1]} was not found'})
+        self.send_json(200, body)
+
+
+def serve(service: Service, port: int) -> None:
+    '''
+    Serves lookups on localhost until interrupted. Requests are handled one at a time
+    because re-reconciling an employee modifies the tree.
+    '''
+    RequestHandler.service = service
+    with HTTPServer(('127.0.0.1', port), RequestHandler) as server:
+        print(f'Serving lookups on http://127.0.0.1:{port} (press Ctrl+C to stop)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
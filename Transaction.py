@@ -1,6 +1,6 @@
 
 import Element
-import Employee
+import Errors
 
 
 class Transaction:
@@ -72,23 +72,33 @@ class Costing(Transaction):
     def build(csv_row: dict, element_table: Element.ElementTable, name_substitutions: dict) -> tuple:
 
         # retrieve and convert all the values that we need
+        # (field is updated as we go so that a failed conversion can be reported)
+        emp_id = None
+        field = 'Employee Number'
         try:
-            emp_id = int(csv_row['Employee Number'].strip())
-            element = csv_row['Element'].strip()
-            company = int(csv_row['Company_PC'].strip())
-            department = int(csv_row['Department_PC'].strip())
-            account = int(csv_row['Account_PC'].strip())
-            uom = csv_row['Unit of Measure'].strip()
-            dr = float(csv_row['Debit Amount'].strip())
-            cr = float(csv_row['Credit Amount'].strip())
+            emp_id = int(csv_row[field].strip())
+            field = 'Element'
+            element = csv_row[field].strip()
+            field = 'Company_PC'
+            company = int(csv_row[field].strip())
+            field = 'Department_PC'
+            department = int(csv_row[field].strip())
+            field = 'Account_PC'
+            account = int(csv_row[field].strip())
+            field = 'Unit of Measure'
+            uom = csv_row[field].strip()
+            field = 'Debit Amount'
+            dr = float(csv_row[field].strip())
+            field = 'Credit Amount'
+            cr = float(csv_row[field].strip())
             amount = round(dr - cr, 2)
-        except Exception as err:
-            raise ValueError(f'An error was encountered while building a CostingTransaction object: {err}')
+        except (ValueError, AttributeError):
+            return (emp_id, None, Errors.ParseError(Errors.BAD_VALUE, field, csv_row[field]), None)
 
         # filter-out hours and zero dollar amounts
 
         if uom != 'Money' or (dr == 0.0 and cr == 0.0):
-            return (None, None, None)
+            return (None, None, None, None)
 
         # make any required element name substitutions
 
@@ -102,27 +112,27 @@ class Costing(Transaction):
         element = element_table.find_by_costing_name(element)
 
         if element is None:
-            raise ValueError(f'{csv_row["Element"]} on the costing files does not exist in the element lookup table.')
+            return (emp_id, None, Errors.ParseError(Errors.UNKNOWN_ELEMENT, 'Element', csv_row['Element']), None)
 
         if not element.should_cost:
-            return (None, None, None)
+            return (None, None, None, None)
 
         if account not in element.debit_accounts and account not in element.credit_accounts:
-            raise ValueError(f'{account} for element {element.costing_name} does not exist in the element lookup table')
+            return (emp_id, None, Errors.ParseError(Errors.INVALID_ACCOUNT, 'Account_PC', account, element.costing_name), None)
 
         if emp_id == 0:
-            raise ValueError('Employee ID can not be zero.')
+            return (emp_id, None, Errors.ParseError(Errors.ZERO_EMPLOYEE, 'Employee Number', emp_id), None)
 
         if company == 0:
-            raise ValueError('Company number can not be zero.')
+            return (emp_id, None, Errors.ParseError(Errors.ZERO_COMPANY, 'Company_PC', company), None)
 
         if department == 0:
-            raise ValueError('Department number can not be zero.')
+            return (emp_id, None, Errors.ParseError(Errors.ZERO_DEPARTMENT, 'Department_PC', department), None)
 
         if account == 0:
-            raise ValueError('Account number can not be zero.')
+            return (emp_id, None, Errors.ParseError(Errors.ZERO_ACCOUNT, 'Account_PC', account), None)
 
-        return (Employee.Employee(emp_id), element, Costing(company, department, account, amount))
+        return (emp_id, element, Costing(company, department, account, amount), None)
 
 
 class Payroll(Transaction):
@@ -142,24 +152,30 @@ class Payroll(Transaction):
     @staticmethod
     def build(csv_row: dict, element_table: Element.ElementTable, name_substitutions: dict) -> tuple:
 
+        emp_id = None
+        field = 'Person Number'
         try:
-            emp_id = int(csv_row['Person Number'].strip())
-            element = csv_row['Balance Name'].strip()
-            category = csv_row['Balance Category'].strip()
-            amount = float(csv_row['Current'].replace(',', '').strip())
-            net_pay = float(csv_row['Net Pay'].replace(',', '').strip())
-        except Exception as err:
-            raise ValueError(f'An error was encountered while building a Payroll Transaction object: {err}')
+            emp_id = int(csv_row[field].strip())
+            field = 'Balance Name'
+            element = csv_row[field].strip()
+            field = 'Balance Category'
+            category = csv_row[field].strip()
+            field = 'Current'
+            amount = float(csv_row[field].replace(',', '').strip())
+            field = 'Net Pay'
+            net_pay = float(csv_row[field].replace(',', '').strip())
+        except (ValueError, AttributeError):
+            return (emp_id, None, Errors.ParseError(Errors.BAD_VALUE, field, csv_row[field]), None)
 
         # ignore rows in the csv file that are zero, imputed, or represent hours
         if amount == 0.0 or 'Imputed'.casefold() in category.casefold() or 'Hours'.casefold() in category.casefold():
-            return (None, None, None)
+            return (None, None, None, None)
 
         if emp_id == 0:
-            raise ValueError('Employee ID can not be zero.')
+            return (emp_id, None, Errors.ParseError(Errors.ZERO_EMPLOYEE, 'Person Number', emp_id), None)
 
         if element == 'Tuition Non Cash':
-            return (None, None, None)
+            return (None, None, None, None)
 
         # make any required element name substitutions
 
@@ -171,9 +187,9 @@ class Payroll(Transaction):
         element = element_table.find_by_payroll_name(element)
 
         if element is None:
-            raise ValueError(f'{csv_row["Balance Name"]} on the payroll register does not exist in the element lookup table.')
+            return (emp_id, None, Errors.ParseError(Errors.UNKNOWN_ELEMENT, 'Balance Name', csv_row['Balance Name']), None)
 
         if not element.should_cost:
-            return (None, None, None)
+            return (None, None, None, None)
 
-        return (Employee.Employee(emp_id, net_pay), element, Payroll(amount))
+        return (emp_id, element, Payroll(amount), round(net_pay, 2))
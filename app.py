@@ -1,10 +1,12 @@
 
+import argparse
 import json
 import os
 import sys
 import openpyxl
 import Element
 import Reconciliation
+import Service
 import pandas as pd
 from datetime import datetime
 
@@ -54,49 +56,103 @@ def create_xlsx_with_tables(file_name: str, descriptors: list) -> None:
     wb.save(file_name)
 
 
+def write_journal_file(file_name: str, je: pd.DataFrame) -> None:
+    '''
+    Writes the correcting JE to a csv file that can be uploaded to the general ledger. The lines
+    are summarized into one debit or credit for each company, department, and account.
+
+    file_name:  The path to the new csv file.
+                The file will be over-written if it already exists
+
+    je:         The DataFrame returned by Reconciliation.Tree.build_correcting_je()
+    '''
+    journal = je.groupby(['Company', 'Department', 'Account'], as_index=False)['Amount'].sum()
+    journal['Amount'] = journal['Amount'].round(2)
+    journal = journal[journal['Amount'] != 0.0]
+    journal['Debit'] = journal['Amount'].clip(lower=0.0)
+    journal['Credit'] = (-journal['Amount']).clip(lower=0.0)
+    journal['Description'] = 'Payroll costing correction'
+    journal[['Company', 'Department', 'Account', 'Debit', 'Credit', 'Description']].to_csv(os.path.abspath(file_name), index=False)
+
+
 def get_config() -> tuple:
     file_name = os.path.abspath('./config files/config.json')
     with open(file_name) as f:
         data = json.load(f)
     input_files = ['./input files/' + f + '.csv' for f in data['Input Files']]
-    output_file = './output files/' + data['Output File'] + ' ' + datetime.today().isoformat(sep=' ', timespec='minutes').replace(':', '') + '.xlsx'
+    timestamp = datetime.today().isoformat(sep=' ', timespec='minutes').replace(':', '')
+    output_file = './output files/' + data['Output File'] + ' ' + timestamp + '.xlsx'
+    journal_file = './output files/' + data['Journal File'] + ' ' + timestamp + '.csv' if data.get('Journal File', None) else None
     name_substitutions = data['Name Substitutions']
     for user_path in data['Local Install Paths']:
         sys.path.append(user_path)
     elements = data['Elements File']
-    return (input_files, output_file, name_substitutions, elements)
+    error_limit = data.get('Error Limit', 1000)
+    tolerance = data.get('Rounding Tolerance', 0.0)
+    cache_size = data.get('Combo Cache Size', 4096)
+    return (input_files, output_file, journal_file, name_substitutions, elements, error_limit, tolerance, cache_size)
+
+
+def print_parse_errors(errors) -> None:
+    print('PARSE ERRORS:')
+    for err in errors:
+        print(f'{err["Description"]}: {err["Field"]} = {err["Value"]}', end='')
+        print(f' for element {err["Element"]}' if err['Element'] else '', end='')
+        print(f' ({err["Count"]} rows, first at {err["File"]} row {err["First Row"]})')
+    print('Number of parse errors:', len(errors))
+    if errors.limit_reached():
+        print(f'Parsing was stopped after {errors.limit} errors. Please correct the input files and try again.')
 
 
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description='Reconciles the detail payroll register to the detail costing files.')
+    parser.add_argument('--serve', action='store_true', help='keep the reconciled pay period in memory and serve lookups on localhost')
+    parser.add_argument('--port', type=int, default=8128, help='the port used by --serve (default: 8128)')
+    args = parser.parse_args()
+
     print('Loading the configuration file...')
-    input_files, output_file, name_substitutions, elements = get_config()
+    input_files, output_file, journal_file, name_substitutions, elements, error_limit, tolerance, cache_size = get_config()
+    Reconciliation.set_combo_cache_size(cache_size)
+
+    if args.serve:
+        print('Parsing and reconciling the payroll files...')
+        service = Service.Service(input_files, elements, name_substitutions, error_limit, tolerance)
+        if len(service.parse_errors) > 0:
+            print_parse_errors(service.parse_errors)
+        else:
+            print('Number of parsed employees:', len(service.tree.tree))
+            Service.serve(service, args.port)
+        sys.exit()
 
     print('Parsing the element lookup table...')
     element_table = Element.Parser.parse(elements)
 
     print('Parsing the payroll files...')
-    tree, errors = Reconciliation.Tree.build(input_files, element_table, name_substitutions)
+    tree, errors = Reconciliation.Tree.build(input_files, element_table, name_substitutions, error_limit)
 
     if len(errors) > 0:
-        print('PARSE ERRORS:')
-        for err in errors:
-            print(err)
-        print('Number of parse errors:', len(errors))
+        print_parse_errors(errors)
     else:
         print('Number of parsed employees:', len(tree.tree))
 
         print('Reconciling payroll transactions...')
-        errors = tree.reconcile()
-        df0 = pd.DataFrame(errors)
+        errors = tree.reconcile(tolerance=tolerance)
+        hits, misses, maxsize, currsize = Reconciliation.combo_cache_info()
+        print(f'Combination cache: {hits} hits, {misses} misses, {currsize} of {maxsize} entries used')
 
         print('Building the table of problematic entries...')
         rows, headers = tree.build_unreconciled_entries()
         df1 = pd.DataFrame(rows, columns=headers)
 
         print('Building the correcting JE...')
-        rows, headers = tree.build_correcting_je()
-        df2 = pd.DataFrame(rows, columns=headers)
+        df2, je_errors = tree.build_correcting_je()
+        errors.extend(je_errors)
+        df0 = pd.DataFrame(errors)
+
+        if journal_file:
+            print('Writing the correcting JE to', journal_file)
+            write_journal_file(journal_file, df2)
 
         print('Building the summary table...')
         rows, headers = tree.build_summary_table()